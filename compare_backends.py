@@ -0,0 +1,276 @@
+import argparse
+import contextlib
+import importlib.util
+import os
+import random
+import tempfile
+import time
+
+from mido import MidiFile
+
+import logic
+
+# Pieces taken from the examples at the bottom of logic.py
+stored_corpus = {
+    'yinyang': "0a9c9d4e4e0f0f0f0f0f0e6d6d9d9c0a9p0f0f0f5d5d0f0f0f0e0a0a9c9c0a0c0f9p0b0d0e2d2d0c0b0a0a0a0a4b9c7c4c0b9p0a0a0a0a0a0b0b0b0b0b0b0a0a0a0a0a",
+    'sans': "0a0a0a4b3b2b1b1b0b0b0b3c5d5d5d6c1b2b2b1b1b6c1b2b2b3b4b0a0a0a9p0a9d0c0a0a0a0a0a0a0a4e0f0f0d0d0f4e0a9c1b4c2e5c7c9c0a0a0c9d0a9p0f0a0a0a0a0a0a0a0a0a0c0d0d0d0d0c0c3c4b4b0a0a0f2b2b0d9d0a0a0f9p0f0a0a0a0a0a0a0a0a0a0a4b4b4b4b0c0c0d0d0d0a0a0f3c3c3c0f0a0a0f9p0c9d0a0a0a0a0a0a0a0a0f0f0f2d2d0f0f1b7c0a0a9c1e8c7c4c0b0a9d0c9p0a0a0c2b3b4b0a0a0a0a0b0d0e0e0e0d0b4b4b0b0c0d0b4b4b3b2b0c0a0a9p0a0a0a0a0a0a0b0b1b1b1b1b1b1b1b0b0b0a0a0b0b0b0b0a0a0a0a0a0a0a",
+    'single': "1d",
+}
+
+
+@contextlib.contextmanager
+def scratch_directory():
+    """
+    Runs the block inside a temporary working directory with console output silenced,
+    since the compilers print every step and write their files to the working directory.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                yield workdir
+        finally:
+            os.chdir(cwd)
+
+
+legacy_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CompilationForReal_OLD.py')
+legacy = None
+
+
+def load_legacy():
+    """
+    Loads CompilationForReal_OLD.py by its path, the first time it is needed.
+    Loading it also runs the example at the bottom of the file, so it happens inside a scratch directory.
+    """
+    global legacy
+    if legacy is None:
+        spec = importlib.util.spec_from_file_location('CompilationForReal_OLD', legacy_file)
+        module = importlib.util.module_from_spec(spec)
+        with scratch_directory():
+            spec.loader.exec_module(module)
+        legacy = module
+    return legacy
+
+
+def run_legacy(text, workdir):
+    """
+    CompilationForReal_OLD.py ends every section with '0o' instead of separating them with '9p',
+    and always saves to result.mid in the working directory.
+    """
+    legacy_text = text.replace('9p', '0o') + '0o'
+    load_legacy().text_to_midi2(legacy_text)
+    return os.path.join(workdir, 'result.mid')
+
+
+def run_current(text, workdir):
+    output_file = os.path.join(workdir, 'current.mid')
+    logic.text_to_midi2(text, output_file=output_file)
+    return output_file
+
+
+def run_mmap(text, workdir, workers=None):
+    input_file = os.path.join(workdir, 'input.txt')
+    with open(input_file, 'w') as f:
+        f.write(text)
+    output_file = os.path.join(workdir, 'mmap.mid')
+    logic.text_file_to_midi(input_file, output_file=output_file, workers=workers)
+    return output_file
+
+
+def run_mmap_pool(text, workdir):
+    return run_mmap(text, workdir, workers=2)
+
+
+# Every backend takes an art string and a scratch directory, and returns the path of its MIDI file.
+# New backends only need to be added here, the first one is the reference the others are compared to.
+backends = {
+    'current': run_current,
+    'legacy': run_legacy,
+    'mmap': run_mmap,
+    'mmap-pool': run_mmap_pool,
+}
+
+# Run once before any backend is timed, for backends that need to load something first
+backend_setup = {
+    'legacy': load_legacy,
+}
+
+# Shown next to the throughput of a backend when its timing includes more than the compiler itself
+backend_notes = {
+    'mmap-pool': "includes starting a process pool for every piece",
+}
+
+
+def generate_corpus(count, seed=0, max_sections=6, max_section_length=30, long_section_length=(100, 170),
+                    invalid_ratio=0.1):
+    """
+    Generates random art strings.
+
+    About a third of the pieces get one long section, long enough for some pitches
+    to fall outside the MIDI range of 0..127. A share of the pieces is made invalid
+    with an unknown token, a stray character or a trailing newline.
+    """
+    rng = random.Random(seed)
+    tokens = [token for token in logic.token_list if token != '9p']
+    corpus = {}
+    for i in range(count):
+        sections = []
+        for _ in range(rng.randint(1, max_sections)):
+            section = rng.choices(tokens, k=rng.randint(1, max_section_length))
+            sections.append(''.join(section))
+        # The grammar parser recurses once per token, so at most one section is long
+        if rng.random() < 1 / 3:
+            long_section = rng.choices(tokens, k=rng.randint(*long_section_length))
+            sections.insert(rng.randrange(len(sections) + 1), ''.join(long_section))
+        text = '9p'.join(sections)
+
+        if rng.random() < invalid_ratio:
+            position = rng.randrange(len(text) // 2 + 1) * 2
+            text = rng.choice([
+                text[:position] + '0z' + text[position:],
+                text[:position] + '0' + text[position:],
+                text + '\n',
+            ])
+        corpus[f'generated-{i}'] = text
+    return corpus
+
+
+def load_corpus(directory):
+    """
+    Loads every .txt file in directory as one art string, exactly as stored.
+    """
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), newline='') as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def read_events(midi_file):
+    """
+    Returns the events of a MIDI file as (track, type, note, velocity, time) tuples.
+    """
+    events = []
+    for track_index, track in enumerate(MidiFile(midi_file).tracks):
+        for msg in track:
+            if msg.is_meta:
+                events.append((track_index, msg.type, None, None, msg.time))
+            else:
+                events.append((track_index, msg.type, msg.note, msg.velocity, msg.time))
+    return events
+
+
+def first_divergence(expected, actual):
+    """
+    Returns (index, expected event, actual event) of the first difference, or None if the streams match.
+    A missing event is reported as None.
+    """
+    for index in range(max(len(expected), len(actual))):
+        expected_event = expected[index] if index < len(expected) else None
+        actual_event = actual[index] if index < len(actual) else None
+        if expected_event != actual_event:
+            return index, expected_event, actual_event
+    return None
+
+
+def run_backend(backend, text):
+    """
+    Runs one backend in a scratch directory.
+    Returns (events, error, corrupt, elapsed seconds), events is None when the backend failed
+    and corrupt is True when it saved a MIDI file that can't be read back.
+    """
+    with scratch_directory() as workdir:
+        start = time.perf_counter()
+        try:
+            midi_file = backend(text, workdir)
+        except Exception as e:
+            return None, str(e), False, time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        # The compilers report their own errors and just don't save a file
+        if not os.path.exists(midi_file):
+            return None, "no MIDI file was generated", False, elapsed
+        try:
+            return read_events(midi_file), None, False, elapsed
+        except Exception as e:
+            return None, f"generated MIDI file can't be read: {e}", True, elapsed
+
+
+def compare(corpus, names, logger=print):
+    """
+    Runs every piece of corpus through every named backend and diffs their events against the first one.
+    A piece that every backend rejects counts as agreement, a backend that saves an unreadable
+    MIDI file always counts as a divergence. Returns the number of divergences.
+    """
+    reference = names[0]
+    elapsed = {name: 0.0 for name in names}
+    characters = {name: 0 for name in names}
+    divergences = 0
+
+    for name in names:
+        if name in backend_setup:
+            backend_setup[name]()
+
+    for piece, text in corpus.items():
+        results = {}
+        for name in names:
+            results[name] = run_backend(backends[name], text)
+            elapsed[name] += results[name][3]
+            characters[name] += len(text)
+
+        for name in names:
+            _, error, corrupt, _ = results[name]
+            if corrupt:
+                logger(f"{piece}: '{name}' {error}")
+                divergences += 1
+
+        expected, expected_error, _, _ = results[reference]
+        for name in names[1:]:
+            actual, actual_error, corrupt, _ = results[name]
+            if corrupt or (expected is None and actual is None):
+                continue
+            if expected is None:
+                logger(f"{piece}: '{reference}' failed ({expected_error}), '{name}' succeeded")
+                divergences += 1
+            elif actual is None:
+                logger(f"{piece}: '{reference}' succeeded, '{name}' failed ({actual_error})")
+                divergences += 1
+            else:
+                divergence = first_divergence(expected, actual)
+                if divergence:
+                    index, expected_event, actual_event = divergence
+                    logger(f"{piece}: '{name}' diverges from '{reference}' at event {index}: "
+                           f"expected {expected_event}, got {actual_event}")
+                    divergences += 1
+
+    total_characters = sum(len(text) for text in corpus.values())
+    logger(f"{len(corpus)} pieces, {total_characters} characters, {divergences} divergences")
+    for name in names:
+        throughput = characters[name] / elapsed[name] if elapsed[name] else 0.0
+        relative = elapsed[reference] / elapsed[name] if elapsed[name] else 0.0
+        note = f" ({backend_notes[name]})" if name in backend_notes else ""
+        logger(f"{name:>12}: {elapsed[name]:.3f}s, {throughput:,.0f} characters/s, {relative:.2f}x {reference}{note}")
+    return divergences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every compiler backend produces the same MIDI events.")
+    parser.add_argument('--backends', nargs='+', choices=list(backends), default=list(backends),
+                        help="backends to run, the first one is the reference")
+    parser.add_argument('--generated', type=int, default=50, help="number of random pieces to generate")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the random pieces")
+    parser.add_argument('--corpus', help="directory of .txt art files to include")
+    args = parser.parse_args()
+
+    corpus = dict(stored_corpus)
+    if args.corpus:
+        corpus.update(load_corpus(args.corpus))
+    corpus.update(generate_corpus(args.generated, args.seed))
+
+    divergences = compare(corpus, args.backends)
+    raise SystemExit(1 if divergences else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
 import math
 import json
+import collections
+import mmap
+import multiprocessing
+import os
+import struct
 from mido import MidiFile, MidiTrack, Message
 
 grammar = {
@@ -291,6 +296,295 @@ def text_to_array(text, logger=None):
         raise f"An unexpected error occurred: {e}"
 
 
+# Memory-mapped file input
+#
+# The functions below compile an art file without reading it into a Python
+# string. The file is mapped with mmap, sections are located by scanning for
+# the '9p' token, and every section is emitted straight from the mapped bytes.
+# Pages that have been compiled are handed back to the kernel, so memory use
+# depends on the size of one section rather than the whole file.
+
+# Same terminal table as the grammar, keyed by the two bytes of the token packed into one int.
+# Each pattern is stored as a bitmask, bit n is set when position n of the pattern is 1.
+token_masks = {}
+for category in ['SingleNote', 'DoubleNote', 'TripleNote', 'QuadNote', 'QuintNote']:
+    for key, value in grammar[category].items():
+        token_masks[(ord(key[0]) << 8) | ord(key[1])] = sum(1 << i for i, note in enumerate(value) if note == 1)
+
+section_separator = b'9p'
+
+# Sections are sent to worker processes in jobs of about this many bytes
+section_batch_bytes = 1 << 16
+# Jobs waiting in the pool per worker, so the scan never runs far ahead of the writer
+jobs_per_worker = 4
+
+
+def release_pages(buf, start, end):
+    """
+    Drops the mapped pages that cover the start and end offsets from resident memory.
+    The bytes stay readable, a later access reads them back from the page cache.
+    """
+    if not hasattr(mmap, 'MADV_DONTNEED'):
+        return
+    start -= start % mmap.PAGESIZE
+    end = min(end, len(buf))
+    if end > start:
+        buf.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def find_sections(buf, start=0, end=None):
+    """
+    Yields the (start, end) byte offsets of every section in buf, split on '9p'.
+    Offsets are relative to buf, nothing is copied. The pages of a section are
+    released once the caller asks for the next one.
+    """
+    if end is None:
+        end = len(buf)
+    section_start = start
+    released = start
+    while True:
+        # Everything before this section has been handed out and compiled already
+        if section_start - released >= mmap.PAGESIZE:
+            release_pages(buf, released, section_start - section_start % mmap.PAGESIZE)
+            released = section_start - section_start % mmap.PAGESIZE
+        found = buf.find(section_separator, section_start, end)
+        if found == -1:
+            found = end
+        # Every token is two characters long, so a real '9p' always sits on an even offset
+        if (found - start) % 2 != 0:
+            raise ValueError("Failed to tokenize")
+        # The grammar needs at least one pattern before and after every '9p'
+        if found == section_start:
+            raise ValueError("Error: Unable to parse the input text according to the grammar.")
+        yield section_start, found
+        if found == end:
+            return
+        section_start = found + len(section_separator)
+
+
+def tokenize_bytes(buf, start, end):
+    """
+    Tokenizes the bytes between the start and end offsets of buf in a single pass.
+    Returns a bytearray with the pattern bitmask of every token.
+    """
+    # Stepped views read the first and second character of every token without copying the section
+    section = memoryview(buf)[start:end]
+    firsts = section[0::token_max_length]
+    seconds = section[1::token_max_length]
+    try:
+        masks = bytearray(len(firsts))
+        for i, (first, second) in enumerate(zip(firsts, seconds)):
+            mask = token_masks.get((first << 8) | second)
+            if mask is None:
+                raise ValueError("Failed to tokenize")
+            masks[i] = mask
+        return masks
+    finally:
+        # The mmap can't be closed while any view on it is still alive
+        seconds.release()
+        firsts.release()
+        section.release()
+
+
+def encode_variable_int(value):
+    """
+    Encodes a delta time as a MIDI variable length quantity.
+    """
+    data = bytearray([value & 0x7f])
+    value >>= 7
+    while value:
+        data.insert(0, (value & 0x7f) | 0x80)
+        value >>= 7
+    return data
+
+
+def encode_section(buf, start, end):
+    """
+    Encodes one section into MIDI track bytes, the same way process_parse_tree does.
+
+    Returns (leading_skips, data, trailing_skips). The delta time of the first
+    note depends on the empty columns of the previous sections, so it is left
+    out of data and written by the caller.
+    """
+    masks = tokenize_bytes(buf, start, end)
+
+    starting_pitch = math.ceil(60 + len(masks) / 2)
+    data = bytearray()
+    leading_skips = None
+    total_skips = 0
+    running_status = None
+
+    def append_event(status, pitch, delta):
+        nonlocal running_status
+        # Same check mido does when text_to_midi2 creates the Message
+        if not 0 <= pitch <= 127:
+            raise ValueError("data byte must be in range 0..127")
+        if delta is not None:
+            data.extend(encode_variable_int(delta))
+        if status != running_status:
+            data.append(status)
+            running_status = status
+        data.append(pitch)
+        data.append(64)
+
+    # Each of the 5 pattern positions is one column of the flipped section
+    for position in range(5):
+        bit = 1 << position
+        pitches = [starting_pitch - i for i, mask in enumerate(masks) if mask & bit]
+        if not pitches:
+            total_skips += 1
+            continue
+
+        if leading_skips is None:
+            leading_skips = total_skips
+            append_event(0x90, pitches[0], None)
+        else:
+            append_event(0x90, pitches[0], total_skips * 100)
+        total_skips = 0
+        for pitch in pitches[1:]:
+            append_event(0x90, pitch, 0)
+
+        append_event(0x80, pitches[0], 100)
+        for pitch in pitches[1:]:
+            append_event(0x80, pitch, 0)
+
+    if leading_skips is None:
+        return total_skips, bytes(data), 0
+    return leading_skips, bytes(data), total_skips
+
+
+def write_midi_stream(encoded_sections, output_file, logger=None):
+    """
+    Writes a single track MIDI file from encoded sections without keeping them in memory.
+    The header matches what mido writes for a default MidiFile.
+    """
+    # Write to a temporary file so an invalid input never leaves a half written MIDI behind
+    temp_file = output_file + '.part'
+    try:
+        with open(temp_file, 'wb') as out:
+            out.write(b'MThd' + struct.pack('>L', 6) + struct.pack('>hhh', 1, 1, 480))
+            out.write(b'MTrk')
+            length_offset = out.tell()
+            out.write(struct.pack('>L', 0))
+
+            track_length = 0
+            total_skips = 0
+            for index, (leading_skips, data, trailing_skips) in enumerate(encoded_sections):
+                if logger:
+                    logger(f"Section {index}: {len(data)} bytes")
+                if not data:
+                    total_skips += leading_skips
+                    continue
+                delta = encode_variable_int((total_skips + leading_skips) * 100)
+                out.write(delta)
+                out.write(data)
+                track_length += len(delta) + len(data)
+                total_skips = trailing_skips
+
+            # End of track
+            out.write(b'\x00\xff\x2f\x00')
+            track_length += 4
+            out.seek(length_offset)
+            out.write(struct.pack('>L', track_length))
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+# The input file as mapped by the current worker process
+_worker_buf = None
+
+
+def _open_worker_file(input_file):
+    """
+    Worker process initializer, maps the input file once for all the jobs of the worker.
+    """
+    global _worker_buf
+    with open(input_file, 'rb') as f:
+        _worker_buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        _worker_buf.madvise(mmap.MADV_SEQUENTIAL)
+
+
+def _encode_file_sections(offsets):
+    """
+    Worker process entry point, encodes a batch of sections by their offsets.
+    """
+    encoded = [encode_section(_worker_buf, start, end) for start, end in offsets]
+    release_pages(_worker_buf, offsets[0][0], offsets[-1][1])
+    return encoded
+
+
+def batch_sections(sections):
+    """
+    Groups the section offsets into jobs of about section_batch_bytes bytes each.
+    """
+    batch = []
+    batch_size = 0
+    for start, end in sections:
+        batch.append((start, end))
+        batch_size += end - start
+        if batch_size >= section_batch_bytes:
+            yield batch
+            batch = []
+            batch_size = 0
+    if batch:
+        yield batch
+
+
+def encode_in_pool(pool, sections, workers):
+    """
+    Encodes the sections in the pool and yields the results in order.
+    Only a few jobs per worker are queued at a time, so the offsets and results
+    waiting in the pool don't grow with the size of the file.
+    """
+    pending = collections.deque()
+    for batch in batch_sections(sections):
+        pending.append(pool.apply_async(_encode_file_sections, (batch,)))
+        if len(pending) >= workers * jobs_per_worker:
+            yield from pending.popleft().get()
+    while pending:
+        yield from pending.popleft().get()
+
+
+def text_file_to_midi(input_file, output_file="result_FIX.mid", logger=None, workers=None):
+    """
+    Compiles an art file into a MIDI file, producing the same output as text_to_midi2.
+
+    The input is memory-mapped and the track is streamed to disk section by
+    section. With workers set, the sections are encoded by a pool of that many
+    processes. Every worker maps the file once and receives batches of section offsets.
+    """
+    try:
+        with open(input_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("Error: Unable to parse the input text according to the grammar.")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    buf.madvise(mmap.MADV_SEQUENTIAL)
+                sections = find_sections(buf)
+                if workers:
+                    with multiprocessing.Pool(workers, initializer=_open_worker_file, initargs=(input_file,)) as pool:
+                        encoded = encode_in_pool(pool, sections, workers)
+                        write_midi_stream(encoded, output_file, logger)
+                else:
+                    encoded = (encode_section(buf, start, end) for start, end in sections)
+                    write_midi_stream(encoded, output_file, logger)
+        if logger:
+            logger(f"MIDI file generated successfully as '{output_file}'.")
+    except ValueError as ve:
+        if logger:
+            logger(str(ve), is_error=True)
+        else:
+            print(f"\033[91m{ve}\033[0m")  # Print error in red text
+    except Exception as e:
+        if logger:
+            logger(f"An unexpected error occurred: {e}", is_error=True)
+        else:
+            print(f"\033[91mAn unexpected error occurred: {e}\033[0m")  # Print unexpected errors in red text
+
+
 # # Example usage:
 # # Test Case 1: Single Token
 # print("=== Test Case 1: simple ===")
@@ -0,0 +1,175 @@
+import argparse
+import contextlib
+import multiprocessing
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from logic import text_to_array
+
+# Pixel values for the cells, the same colours draw_visual_preview uses
+BLACK = 0
+WHITE = 255
+
+# Cell kinds in the grid, cells that a shorter section doesn't have are left blank
+MISSING_CELL = 0
+EMPTY_CELL = 1
+FILLED_CELL = 2
+
+
+def array_to_grid(data):
+    """
+    Converts the output of text_to_array into a 2D grid of cell kinds,
+    laid out the same way as the visual preview (each row of data is one column on screen).
+    """
+    height = max((len(row) for row in data), default=0)
+    grid = np.full((height, len(data)), MISSING_CELL, dtype=np.uint8)
+    for x, row in enumerate(data):
+        grid[:len(row), x] = np.asarray(row, dtype=np.uint8) + EMPTY_CELL
+    return grid
+
+
+def cell_tiles(cell_size):
+    """
+    Returns the pixel tile for every cell kind, indexed by the cell kind.
+    Filled cells are black, empty cells are white with a black outline, missing cells are plain white.
+    """
+    tiles = np.full((3, cell_size, cell_size), WHITE, dtype=np.uint8)
+    tiles[FILLED_CELL] = BLACK
+    if cell_size > 2:
+        tiles[EMPTY_CELL, [0, -1], :] = BLACK
+        tiles[EMPTY_CELL, :, [0, -1]] = BLACK
+    return tiles
+
+
+def rasterize(data, cell_size=4):
+    """
+    Rasterizes the output of text_to_array into an 8-bit grayscale image array.
+    """
+    if cell_size < 1:
+        raise ValueError("Cell size must be at least 1 pixel.")
+    grid = array_to_grid(data)
+    height, width = grid.shape
+    # Look up the tile of every cell at once, then interleave the tile rows with the grid rows
+    pixels = cell_tiles(cell_size)[grid]
+    return pixels.transpose(0, 2, 1, 3).reshape(height * cell_size, width * cell_size)
+
+
+def encode_pgm(image):
+    """
+    Encodes a grayscale image array as binary PGM bytes.
+    """
+    height, width = image.shape
+    return b'P5\n%d %d\n255\n' % (width, height) + image.tobytes()
+
+
+def encode_png(image):
+    """
+    Encodes a grayscale image array as PNG bytes.
+    """
+    height, width = image.shape
+
+    def chunk(chunk_type, data):
+        return (struct.pack('>L', len(data)) + chunk_type + data
+                + struct.pack('>L', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    # Every scanline starts with filter type 0 (None)
+    scanlines = np.zeros((height, width + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image
+    header = struct.pack('>LLBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+encoders = {
+    'png': encode_png,
+    'pgm': encode_pgm,
+}
+
+
+def text_to_image(text, cell_size=4, image_format='png'):
+    """
+    Renders an art string into PNG or PGM bytes without needing a display.
+    """
+    if image_format not in encoders:
+        raise ValueError(f"Unsupported image format '{image_format}'.")
+    return encoders[image_format](rasterize(text_to_array(text), cell_size))
+
+
+def thumbnail_path(midi_file, image_format='png'):
+    """
+    Returns the path of the thumbnail that sits next to a MIDI file.
+    """
+    return os.path.splitext(midi_file)[0] + '.' + image_format
+
+
+def _export_thumbnail(args):
+    """
+    Renders one art string and writes it next to its MIDI file.
+    Returns (midi_file, thumbnail_file, error).
+    """
+    text, midi_file, cell_size, image_format = args
+    output_file = thumbnail_path(midi_file, image_format)
+    try:
+        # The parser prints every step, which only slows bulk exports down
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            image = text_to_image(text, cell_size, image_format)
+        with open(output_file, 'wb') as f:
+            f.write(image)
+        return midi_file, output_file, None
+    except Exception as e:
+        return midi_file, None, str(e)
+
+
+def export_batch(jobs, cell_size=4, image_format='png', workers=None, logger=None):
+    """
+    Writes a thumbnail next to every MIDI file in jobs, a list of (text, midi_file) pairs.
+    With workers set, the pieces are rendered by a pool of that many processes.
+    Returns the number of thumbnails that failed to render.
+    """
+    tasks = ((text, midi_file, cell_size, image_format) for text, midi_file in jobs)
+    failures = 0
+
+    def report(results):
+        nonlocal failures
+        for midi_file, output_file, error in results:
+            if error:
+                failures += 1
+                if logger:
+                    logger(f"{midi_file}: {error}", is_error=True)
+                else:
+                    print(f"\033[91m{midi_file}: {error}\033[0m")  # Print error in red text
+            elif logger:
+                logger(f"Thumbnail generated successfully as '{output_file}'.")
+
+    if workers:
+        with multiprocessing.Pool(workers) as pool:
+            report(pool.imap_unordered(_export_thumbnail, tasks, chunksize=64))
+    else:
+        report(map(_export_thumbnail, tasks))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export thumbnails of art files next to their MIDI files.")
+    parser.add_argument('files', nargs='+', help="art files, each thumbnail is named after the file's MIDI output")
+    parser.add_argument('--cell-size', type=int, default=4, help="size of one cell in pixels")
+    parser.add_argument('--format', choices=sorted(encoders), default='png', help="image format")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    def jobs():
+        for path in args.files:
+            with open(path) as f:
+                yield f.read().strip(), os.path.splitext(path)[0] + '.mid'
+
+    failures = export_batch(jobs(), args.cell_size, args.format, args.workers)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()